@@ -5,11 +5,11 @@ Exposes ALL faster-whisper transcribe() parameters as form fields,
 unlike speaches-ai which only passes 10 of 32.
 
 Usage:
-    pip install faster-whisper fastapi uvicorn python-multipart
+    pip install faster-whisper fastapi uvicorn python-multipart orjson
     python server.py
 
     # Or with env vars:
-    WHISPER_MODEL=large-v3 DEVICE=cuda COMPUTE_TYPE=float16 python server.py
+    WHISPER_MODEL=large-v3 DEVICE=cuda COMPUTE_TYPE=int8_float16 python server.py
 
 Endpoints:
     POST /v1/audio/transcriptions  — OpenAI-compatible transcription
@@ -17,48 +17,149 @@ Endpoints:
     GET  /health                   — Health check
 """
 
-import io
+import asyncio
+import functools
 import os
-import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
+import numpy as np
+import orjson
 import uvicorn
-from fastapi import FastAPI, File, Form, UploadFile
-from fastapi.responses import JSONResponse, PlainTextResponse
-from faster_whisper import WhisperModel
+from fastapi import FastAPI, File, Form, HTTPException, Response, UploadFile
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+from faster_whisper import BatchedInferencePipeline, WhisperModel
 
 # ---------------------------------------------------------------------------
 # Configuration (env vars)
 # ---------------------------------------------------------------------------
 MODEL_ID = os.environ.get("WHISPER_MODEL", "large-v3")
 DEVICE = os.environ.get("DEVICE", "auto")
-COMPUTE_TYPE = os.environ.get("COMPUTE_TYPE", "float16")
+COMPUTE_TYPE = os.environ.get("COMPUTE_TYPE", "int8_float16")
+# Single GPU ("0") or comma-separated list ("0,1") to load a replica per GPU
+GPU_INDEX = [int(i) for i in os.environ.get("GPU_INDEX", "0").split(",") if i.strip()]
+# CTranslate2 threading: CPU_THREADS is intra-op threads per worker (0 = its
+# default), NUM_WORKERS is replicas per device in GPU_INDEX (parallel
+# transcriptions per device)
+CPU_THREADS = int(os.environ.get("CPU_THREADS", "0"))
+NUM_WORKERS = int(os.environ.get("NUM_WORKERS", "1"))
+# Max transcriptions in flight per worker, sequential and batched. The two
+# limits are independent, so up to CONCURRENCY + BATCHED_CONCURRENCY can run
+# at once. Bounds VRAM under bursts. CONCURRENCY defaults to the replica
+# count, len(GPU_INDEX) * NUM_WORKERS; values above it queue inside
+# CTranslate2 instead of adding parallelism.
+REPLICAS = len(GPU_INDEX) * NUM_WORKERS
+CONCURRENCY = int(os.environ.get("CONCURRENCY", str(REPLICAS)))
+BATCHED_CONCURRENCY = int(os.environ.get("BATCHED_CONCURRENCY", "1"))
+# A zero-permit semaphore would hang every request, so fail at startup instead
+for _name, _value in (
+    ("GPU_INDEX device count", len(GPU_INDEX)),
+    ("NUM_WORKERS", NUM_WORKERS),
+    ("CONCURRENCY", CONCURRENCY),
+    ("BATCHED_CONCURRENCY", BATCHED_CONCURRENCY),
+):
+    if _value < 1:
+        raise ValueError(f"{_name} must be at least 1, got {_value}")
 HOST = os.environ.get("HOST", "0.0.0.0")
 PORT = int(os.environ.get("PORT", "8000"))
+# Each uvicorn worker is a separate process that loads its own replica on
+# every GPU in GPU_INDEX; use one worker with a device list for multi-GPU
+WORKERS = int(os.environ.get("WORKERS", "1"))
 
 # ---------------------------------------------------------------------------
 # App + model
 # ---------------------------------------------------------------------------
 app = FastAPI(title="faster-whisper-server", version="1.0.0")
 whisper_model: Optional[WhisperModel] = None
+batched_model: Optional[BatchedInferencePipeline] = None
+
+transcribe_sem = asyncio.Semaphore(CONCURRENCY)
+batched_sem = asyncio.Semaphore(BATCHED_CONCURRENCY)
+
+# Options BatchedInferencePipeline.transcribe (faster-whisper>=1.1) accepts but
+# overrides or ignores: name -> (sequential default, value batched mode uses;
+# IGNORED = not used at all). A request that sets one of them to anything else
+# would silently lose it.
+IGNORED = object()
+BATCHED_OVERRIDES = {
+    "condition_on_previous_text": (True, False),
+    "hallucination_silence_threshold": (None, None),
+    "max_initial_timestamp": (1.0, 0.0),
+    "prompt_reset_on_temperature": (0.5, 0.5),
+    "compression_ratio_threshold": (2.4, IGNORED),
+    "log_prob_threshold": (-1.0, IGNORED),
+    "no_speech_threshold": (0.6, IGNORED),
+}
+
+
+def unsupported_batched_opts(opts: dict) -> list[str]:
+    """Names of options the batched pipeline would override or ignore."""
+    dropped = [
+        k for k, (default, batched) in BATCHED_OVERRIDES.items()
+        if opts[k] != default and opts[k] != batched
+    ]
+    # Batched mode decodes at temperature[0] only, with no fallback
+    if isinstance(opts["temperature"], tuple) and len(opts["temperature"]) > 1:
+        dropped.append("temperature")
+    # VAD chunks are capped at chunk_length instead of max_speech_duration_s
+    if (opts["vad_parameters"] or {}).get("max_speech_duration_s", float("inf")) != float("inf"):
+        dropped.append("vad_max_speech_duration_s")
+    return sorted(dropped)
 
 
 @app.on_event("startup")
 def load_model():
-    global whisper_model
-    print(f"Loading model: {MODEL_ID} (device={DEVICE}, compute_type={COMPUTE_TYPE})")
-    whisper_model = WhisperModel(MODEL_ID, device=DEVICE, compute_type=COMPUTE_TYPE)
+    global whisper_model, batched_model, COMPUTE_TYPE, _HEALTH_JSON
+    print(f"Loading model: {MODEL_ID} (device={DEVICE}, device_index={GPU_INDEX}, "
+          f"compute_type={COMPUTE_TYPE}, cpu_threads={CPU_THREADS}, "
+          f"num_workers={NUM_WORKERS}, pid={os.getpid()})")
+    model_kwargs = dict(
+        device=DEVICE,
+        device_index=GPU_INDEX,
+        cpu_threads=CPU_THREADS,
+        num_workers=NUM_WORKERS,
+    )
+    try:
+        whisper_model = WhisperModel(MODEL_ID, compute_type=COMPUTE_TYPE, **model_kwargs)
+    except ValueError as e:
+        # GPUs without int8 tensor cores reject int8_* compute types, and CPUs
+        # reject float16 ones; "auto" picks the fastest type the device supports
+        if not COMPUTE_TYPE.startswith("int8"):
+            raise
+        print(f"compute_type={COMPUTE_TYPE} unsupported ({e}), falling back to auto")
+        COMPUTE_TYPE = "auto"
+        whisper_model = WhisperModel(MODEL_ID, compute_type=COMPUTE_TYPE, **model_kwargs)
+    batched_model = BatchedInferencePipeline(model=whisper_model)
+    _HEALTH_JSON = build_health_json()  # compute_type may have fallen back
     print("Model loaded.")
 
+    # Warm up on 1s of silence so cuDNN/cuBLAS init and allocator growth
+    # happen here instead of on the first real request. beam_size matches
+    # the endpoint default so the same decode kernels get exercised. One
+    # concurrent run per replica, so CTranslate2 hands each replica one.
+    def warm_up(_replica):
+        segments, _ = whisper_model.transcribe(
+            np.zeros(16000, dtype=np.float32), language="en", beam_size=5
+        )
+        for _ in segments:
+            pass
+
+    t0 = time.time()
+    with ThreadPoolExecutor(max_workers=REPLICAS) as pool:
+        list(pool.map(warm_up, range(REPLICAS)))  # re-raises warm-up errors
+    print(f"Warm-up of {REPLICAS} replica(s) done in {time.time() - t0:.2f}s.")
+
 
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
+@functools.lru_cache(maxsize=128)
 def parse_temperature(raw: str):
-    """Parse temperature as float or comma-separated fallback list."""
+    """Parse temperature as float or comma-separated fallback tuple (cached)."""
     if "," in raw:
-        return [float(t.strip()) for t in raw.split(",") if t.strip()]
+        return tuple(float(t.strip()) for t in raw.split(",") if t.strip())
     val = float(raw)
     # Single 0.0 → use faster-whisper default fallback behavior
     if val == 0.0:
@@ -66,40 +167,132 @@ def parse_temperature(raw: str):
     return val
 
 
+@functools.lru_cache(maxsize=128)
+def parse_suppress_tokens(raw: str) -> tuple[int, ...]:
+    """Parse comma-separated token IDs (cached)."""
+    return tuple(int(t.strip()) for t in raw.split(",") if t.strip())
+
+
+def _format_ts(seconds: float, sep: str) -> str:
+    ms_total = int(seconds * 1000 + 0.5)
+    s_total, ms = divmod(ms_total, 1000)
+    m_total, s = divmod(s_total, 60)
+    h, m = divmod(m_total, 60)
+    return f"{h:02d}:{m:02d}:{s:02d}{sep}{ms:03d}"
+
+
 def format_timestamp(seconds: float) -> str:
-    """Format seconds as SRT/VTT timestamp."""
-    h = int(seconds // 3600)
-    m = int((seconds % 3600) // 60)
-    s = int(seconds % 60)
-    ms = int((seconds % 1) * 1000)
-    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+    """Format seconds as SRT timestamp."""
+    return _format_ts(seconds, ",")
 
 
 def format_vtt_timestamp(seconds: float) -> str:
-    h = int(seconds // 3600)
-    m = int((seconds % 3600) // 60)
-    s = int(seconds % 60)
-    ms = int((seconds % 1) * 1000)
-    return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
+    return _format_ts(seconds, ".")
+
+
+def segment_to_dict(seg, want_words: bool) -> dict:
+    """Convert a faster-whisper Segment to the verbose_json segment shape.
+
+    Floats are passed through unrounded; orjson serializes them directly and
+    rounding here would cost several Python calls per word.
+    """
+    seg_dict = {
+        "id": seg.id,
+        "start": seg.start,
+        "end": seg.end,
+        "text": seg.text,
+        "avg_logprob": seg.avg_logprob,
+        "compression_ratio": seg.compression_ratio,
+        "no_speech_prob": seg.no_speech_prob,
+        "temperature": seg.temperature,
+    }
+    if want_words and seg.words:
+        seg_dict["words"] = [
+            {
+                "word": w.word,
+                "start": w.start,
+                "end": w.end,
+                "probability": w.probability,
+            }
+            for w in seg.words
+        ]
+    return seg_dict
+
+
+def collect_segments(segments_gen, want_words: bool):
+    """Drain the segment generator, return (segments, words, full_text)."""
+    result_segments = []
+    all_words = []
+    full_text_parts = []
+
+    # Bind hot-loop methods to locals (LOAD_FAST instead of LOAD_ATTR)
+    _rs_append = result_segments.append
+    _ft_append = full_text_parts.append
+    _aw_extend = all_words.extend
+
+    for seg in segments_gen:
+        seg_dict = segment_to_dict(seg, want_words)
+        if "words" in seg_dict:
+            _aw_extend(seg_dict["words"])
+        _rs_append(seg_dict)
+        _ft_append(seg.text)
+
+    return result_segments, all_words, "".join(full_text_parts).strip()
+
+
+def json_response(body: dict) -> Response:
+    """Serialize with orjson; word start/end/probability are numpy floats."""
+    return Response(
+        orjson.dumps(body, option=orjson.OPT_SERIALIZE_NUMPY),
+        media_type="application/json",
+    )
+
+
+def ndjson_lines(segments_gen, info, want_words: bool, t0: float):
+    """Yield one JSON line per segment as it decodes, then a summary line."""
+    full_text_parts = []
+    for seg in segments_gen:
+        seg_dict = segment_to_dict(seg, want_words)
+        seg_dict["type"] = "segment"
+        full_text_parts.append(seg.text)
+        # Word values are numpy floats, as in json_response()
+        yield orjson.dumps(seg_dict, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n"
+
+    yield orjson.dumps({
+        "type": "summary",
+        "language": info.language,
+        "duration": round(info.duration, 3),
+        "text": "".join(full_text_parts).strip(),
+        "processing_time": round(time.time() - t0, 3),
+    }) + b"\n"
+
+
+async def stream_ndjson(segments_gen, info, want_words: bool, t0: float, sem):
+    """Stream ndjson_lines() from a threadpool while holding sem.
+
+    Decoding happens while the generator is consumed, so the semaphore is
+    (re)acquired here rather than carried over from the handler; a client
+    that disconnects before the body starts can't leak a permit.
+    """
+    async with sem:
+        async for line in iterate_in_threadpool(ndjson_lines(segments_gen, info, want_words, t0)):
+            yield line
 
 
 def segments_to_srt(segments):
-    lines = []
-    for i, seg in enumerate(segments, 1):
-        lines.append(str(i))
-        lines.append(f"{format_timestamp(seg['start'])} --> {format_timestamp(seg['end'])}")
-        lines.append(seg["text"].strip())
-        lines.append("")
-    return "\n".join(lines)
+    return "\n".join(
+        f"{i}\n{format_timestamp(seg['start'])} --> {format_timestamp(seg['end'])}\n"
+        f"{seg['text'].strip()}\n"
+        for i, seg in enumerate(segments, 1)
+    )
 
 
 def segments_to_vtt(segments):
-    lines = ["WEBVTT", ""]
-    for seg in segments:
-        lines.append(f"{format_vtt_timestamp(seg['start'])} --> {format_vtt_timestamp(seg['end'])}")
-        lines.append(seg["text"].strip())
-        lines.append("")
-    return "\n".join(lines)
+    return "WEBVTT\n\n" + "\n".join(
+        f"{format_vtt_timestamp(seg['start'])} --> {format_vtt_timestamp(seg['end'])}\n"
+        f"{seg['text'].strip()}\n"
+        for seg in segments
+    )
 
 
 # ---------------------------------------------------------------------------
@@ -143,6 +336,8 @@ async def transcribe(
     vad_min_silence_duration_ms: int = Form(2000),
     vad_max_speech_duration_s: float = Form(float("inf")),
     vad_speech_pad_ms: int = Form(400),
+    # --- Batched inference ---
+    batch_size: int = Form(1),
 ):
     t0 = time.time()
 
@@ -156,8 +351,8 @@ async def transcribe(
     # Parse temperature (single float or fallback list)
     temp = parse_temperature(temperature)
 
-    # Parse suppress_tokens
-    sup_tokens = [int(t.strip()) for t in suppress_tokens.split(",") if t.strip()]
+    # Parse suppress_tokens (faster-whisper mutates the list, so copy the cached tuple)
+    sup_tokens = list(parse_suppress_tokens(suppress_tokens))
 
     # Build VAD parameters dict (only if vad_filter enabled)
     vad_params = None
@@ -170,79 +365,83 @@ async def transcribe(
             speech_pad_ms=vad_speech_pad_ms,
         )
 
-    # Write upload to temp file (faster-whisper needs a file path)
-    data = await file.read()
-    suffix = os.path.splitext(file.filename or "audio.wav")[1] or ".wav"
-    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
-        tmp.write(data)
-        tmp_path = tmp.name
-
+    opts = dict(
+        language=language,
+        task="transcribe",
+        beam_size=beam_size,
+        best_of=best_of,
+        patience=patience,
+        length_penalty=length_penalty,
+        repetition_penalty=repetition_penalty,
+        no_repeat_ngram_size=no_repeat_ngram_size,
+        temperature=temp,
+        compression_ratio_threshold=compression_ratio_threshold,
+        log_prob_threshold=log_prob_threshold,
+        no_speech_threshold=no_speech_threshold,
+        condition_on_previous_text=condition_on_previous_text,
+        prompt_reset_on_temperature=prompt_reset_on_temperature,
+        initial_prompt=prompt,
+        suppress_blank=suppress_blank,
+        suppress_tokens=sup_tokens,
+        max_new_tokens=max_new_tokens,
+        max_initial_timestamp=max_initial_timestamp,
+        word_timestamps=want_words,
+        without_timestamps=without_timestamps,
+        hallucination_silence_threshold=hallucination_silence_threshold,
+        hotwords=hotwords,
+        vad_filter=vad_filter,
+        vad_parameters=vad_params,
+    )
+
+    # Batched mode splits audio into VAD chunks, so it only applies when
+    # vad_filter is on; otherwise fall back to the sequential path.
+    use_batched = batch_size > 1 and vad_filter
+    if use_batched:
+        dropped = unsupported_batched_opts(opts)
+        if dropped:
+            raise HTTPException(
+                status_code=400,
+                detail=f"batch_size>1 ignores or overrides: {', '.join(dropped)} "
+                       f"(send batch_size=1 to use them, or a single temperature)",
+            )
+    sem = batched_sem if use_batched else transcribe_sem
+
+    def run_model(audio):
+        if use_batched:
+            return batched_model.transcribe(audio, batch_size=batch_size, **opts)
+        return whisper_model.transcribe(audio, **opts)
+
+    # UploadFile.file is already a SpooledTemporaryFile (1 MB in memory, then
+    # disk); PyAV demuxes it directly, so no extra copy is needed.
+    file.file.seek(0)
+
+    # Model work runs in a thread so the event loop keeps serving other
+    # requests; sem bounds how many run on the model at once.
+    await sem.acquire()
     try:
-        segments_gen, info = whisper_model.transcribe(
-            tmp_path,
-            language=language,
-            task="transcribe",
-            beam_size=beam_size,
-            best_of=best_of,
-            patience=patience,
-            length_penalty=length_penalty,
-            repetition_penalty=repetition_penalty,
-            no_repeat_ngram_size=no_repeat_ngram_size,
-            temperature=temp,
-            compression_ratio_threshold=compression_ratio_threshold,
-            log_prob_threshold=log_prob_threshold,
-            no_speech_threshold=no_speech_threshold,
-            condition_on_previous_text=condition_on_previous_text,
-            prompt_reset_on_temperature=prompt_reset_on_temperature,
-            initial_prompt=prompt,
-            suppress_blank=suppress_blank,
-            suppress_tokens=sup_tokens,
-            max_new_tokens=max_new_tokens,
-            max_initial_timestamp=max_initial_timestamp,
-            word_timestamps=want_words,
-            without_timestamps=without_timestamps,
-            hallucination_silence_threshold=hallucination_silence_threshold,
-            hotwords=hotwords,
-            vad_filter=vad_filter,
-            vad_parameters=vad_params,
+        segments_gen, info = await asyncio.to_thread(run_model, file.file)
+    except BaseException:
+        sem.release()
+        raise
+
+    # Stream segments as they decode; stream_ndjson re-acquires sem itself
+    if response_format == "ndjson":
+        sem.release()
+        return StreamingResponse(
+            stream_ndjson(segments_gen, info, want_words, t0, sem),
+            media_type="application/x-ndjson",
         )
 
-        # Consume the generator
-        result_segments = []
-        all_words = []
-        full_text_parts = []
-
-        for seg in segments_gen:
-            seg_dict = {
-                "id": seg.id,
-                "start": round(seg.start, 3),
-                "end": round(seg.end, 3),
-                "text": seg.text,
-                "avg_logprob": round(seg.avg_logprob, 4),
-                "compression_ratio": round(seg.compression_ratio, 4),
-                "no_speech_prob": round(seg.no_speech_prob, 4),
-                "temperature": seg.temperature,
-            }
-            if want_words and seg.words:
-                seg_dict["words"] = [
-                    {
-                        "word": w.word,
-                        "start": round(w.start, 3),
-                        "end": round(w.end, 3),
-                        "probability": round(w.probability, 4),
-                    }
-                    for w in seg.words
-                ]
-                all_words.extend(seg_dict["words"])
-            result_segments.append(seg_dict)
-            full_text_parts.append(seg.text)
-
-        full_text = "".join(full_text_parts).strip()
-        duration = round(info.duration, 3)
-        processing_time = round(time.time() - t0, 3)
-
+    # Consume the generator (this is where most decoding happens)
+    try:
+        result_segments, all_words, full_text = await asyncio.to_thread(
+            collect_segments, segments_gen, want_words
+        )
     finally:
-        os.unlink(tmp_path)
+        sem.release()
+
+    duration = round(info.duration, 3)
+    processing_time = round(time.time() - t0, 3)
 
     # --- Format response ---
     if response_format == "text":
@@ -255,7 +454,7 @@ async def transcribe(
         return PlainTextResponse(segments_to_vtt(result_segments), media_type="text/plain")
 
     if response_format == "verbose_json":
-        return JSONResponse({
+        return json_response({
             "task": "transcribe",
             "language": info.language,
             "duration": duration,
@@ -266,7 +465,7 @@ async def transcribe(
         })
 
     # Default: json
-    return JSONResponse({
+    return json_response({
         "text": full_text,
     })
 
@@ -274,35 +473,55 @@ async def transcribe(
 # ---------------------------------------------------------------------------
 # GET /v1/models
 # ---------------------------------------------------------------------------
+# Static for the life of the process, so encode once
+_MODELS_JSON = orjson.dumps({
+    "object": "list",
+    "data": [
+        {
+            "id": MODEL_ID,
+            "object": "model",
+            "owned_by": "local",
+        }
+    ],
+})
+
+
 @app.get("/v1/models")
-def list_models():
-    return {
-        "object": "list",
-        "data": [
-            {
-                "id": MODEL_ID,
-                "object": "model",
-                "owned_by": "local",
-            }
-        ],
-    }
+async def list_models():
+    return Response(_MODELS_JSON, media_type="application/json")
 
 
 # ---------------------------------------------------------------------------
 # GET /health
 # ---------------------------------------------------------------------------
-@app.get("/health")
-def health():
-    return {
+def build_health_json() -> bytes:
+    return orjson.dumps({
         "status": "ok",
         "model": MODEL_ID,
         "device": DEVICE,
         "compute_type": COMPUTE_TYPE,
-    }
+    })
+
+
+# Rebuilt by load_model() once the actual compute_type is known
+_HEALTH_JSON = build_health_json()
+
+
+@app.get("/health")
+async def health():
+    return Response(_HEALTH_JSON, media_type="application/json")
 
 
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
 if __name__ == "__main__":
-    uvicorn.run(app, host=HOST, port=PORT)
+    # Import string so uvicorn can spawn WORKERS processes; app_dir makes it
+    # resolvable when launched from another directory (start.sh/start.bat).
+    uvicorn.run(
+        "server:app",
+        host=HOST,
+        port=PORT,
+        workers=WORKERS,
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+    )
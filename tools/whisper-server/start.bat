@@ -3,7 +3,7 @@ REM Start the faster-whisper API server
 REM Usage: start.bat [model] [device] [compute_type] [port]
 REM
 REM Examples:
-REM   start.bat                                    (large-v3, auto, float16, port 8000)
+REM   start.bat                                    (large-v3, auto, int8_float16, port 8000)
 REM   start.bat large-v3 cuda float16 8000         (explicit)
 REM   start.bat distil-large-v3 cpu int8 9000      (CPU mode)
 
@@ -16,7 +16,7 @@ set DEVICE=%~2
 if "%DEVICE%"=="" set DEVICE=auto
 
 set COMPUTE_TYPE=%~3
-if "%COMPUTE_TYPE%"=="" set COMPUTE_TYPE=float16
+if "%COMPUTE_TYPE%"=="" set COMPUTE_TYPE=int8_float16
 
 set PORT=%~4
 if "%PORT%"=="" set PORT=8000
@@ -3,7 +3,7 @@
 # Usage: ./start.sh [model] [device] [compute_type] [port]
 #
 # Examples:
-#   ./start.sh                                    (large-v3, auto, float16, port 8000)
+#   ./start.sh                                    (large-v3, auto, int8_float16, port 8000)
 #   ./start.sh large-v3 cuda float16 8000         (explicit)
 #   ./start.sh distil-large-v3 cpu int8 9000      (CPU mode)
 
@@ -11,7 +11,7 @@ set -e
 
 export WHISPER_MODEL="${1:-large-v3}"
 export DEVICE="${2:-auto}"
-export COMPUTE_TYPE="${3:-float16}"
+export COMPUTE_TYPE="${3:-int8_float16}"
 export PORT="${4:-8000}"
 
 echo "============================================"
@@ -1,12 +1,33 @@
-"""Parameter sweep for faster-whisper on P25 radio audio."""
+"""Parameter sweep for faster-whisper on P25 radio audio.
 
-import json
+Runs faster-whisper in-process (no server.py / HTTP round-trip) so the model
+stays resident across every config and file.
+
+Usage:
+    pip install faster-whisper
+    python sweep.py
+
+    # Or with env vars:
+    WHISPER_MODEL=large-v3 DEVICE=cuda COMPUTE_TYPE=float16 python sweep.py
+
+Files within a config are transcribed CONCURRENCY at a time (default 4) to
+keep the GPU fed. proc_time is per-file wall time, so it includes time spent
+sharing the GPU; set CONCURRENCY=1 when comparing processing times.
+"""
+
+import asyncio
+import inspect
 import os
-import subprocess
-import sys
 import time
 
-URL = "http://localhost:8000/v1/audio/transcriptions"
+import numpy as np
+from faster_whisper import WhisperModel
+from faster_whisper.audio import decode_audio
+
+MODEL_ID = os.environ.get("WHISPER_MODEL", "large-v3")
+DEVICE = os.environ.get("DEVICE", "cuda")
+COMPUTE_TYPE = os.environ.get("COMPUTE_TYPE", "float16")
+CONCURRENCY = int(os.environ.get("CONCURRENCY", "4"))
 
 FILES = [
     r"D:\Downloads\test_audio\11501-1732852092-101.m4a",
@@ -19,57 +40,202 @@ FILES = [
 
 OUTFILE = os.path.join(os.path.dirname(__file__), "sweep-results.txt")
 
-
-def run_test(label: str, params: dict) -> list[dict]:
-    """Run one test config across all files, return results."""
-    results = []
+print(f"Loading model: {MODEL_ID} (device={DEVICE}, compute_type={COMPUTE_TYPE})")
+# num_workers lets CTranslate2 run transcribe() calls from several threads in parallel
+model = WhisperModel(
+    MODEL_ID, device=DEVICE, compute_type=COMPUTE_TYPE, num_workers=CONCURRENCY
+)
+print("Model loaded.")
+
+
+def load_audio(path: str) -> np.ndarray:
+    """Decode to a C-contiguous float32 array faster-whisper can use without copying.
+
+    The array is marked read-only since it's shared by every config and,
+    with CONCURRENCY > 1, by several transcriptions at once.
+    """
+    a = np.ascontiguousarray(decode_audio(path, sampling_rate=16000), dtype=np.float32)
+    assert a.dtype == np.float32 and a.flags["C_CONTIGUOUS"]
+    a.flags.writeable = False
+    return a
+
+
+# Decode each file once (16 kHz mono float32) and reuse the array for every
+# config instead of re-running the FFmpeg demux/resample per transcription.
+AUDIO_CACHE = {f: load_audio(f) for f in FILES if os.path.exists(f)}
+
+
+# Form-field name -> type, mirroring the server.py endpoint signature so TESTS
+# can keep using the same string values the HTTP sweep sent.
+PARAM_TYPES = {
+    "beam_size": int,
+    "best_of": int,
+    "patience": float,
+    "length_penalty": float,
+    "repetition_penalty": float,
+    "no_repeat_ngram_size": int,
+    "compression_ratio_threshold": float,
+    "log_prob_threshold": float,
+    "no_speech_threshold": float,
+    "condition_on_previous_text": bool,
+    "prompt_reset_on_temperature": float,
+    "suppress_blank": bool,
+    "max_new_tokens": int,
+    "max_initial_timestamp": float,
+    "hallucination_silence_threshold": float,
+    "hotwords": str,
+    "without_timestamps": bool,
+    "vad_filter": bool,
+}
+
+# server.py's vad_* form defaults, so VAD rows measure what the server does
+# rather than faster-whisper's own VadOptions defaults
+SERVER_VAD_DEFAULTS = {
+    "threshold": 0.5,
+    "min_speech_duration_ms": 250,
+    "min_silence_duration_ms": 2000,
+    "max_speech_duration_s": float("inf"),
+    "speech_pad_ms": 400,
+}
+
+VAD_PARAM_TYPES = {
+    "vad_threshold": ("threshold", float),
+    "vad_min_speech_duration_ms": ("min_speech_duration_ms", int),
+    "vad_min_silence_duration_ms": ("min_silence_duration_ms", int),
+    "vad_max_speech_duration_s": ("max_speech_duration_s", float),
+    "vad_speech_pad_ms": ("speech_pad_ms", int),
+}
+
+
+def to_kwargs(params: dict) -> dict:
+    """Convert string form params into model.transcribe() keyword arguments."""
+    kwargs = {}
+    vad_params = {}
+    for k, v in params.items():
+        if k == "temperature":
+            if "," in v:
+                kwargs[k] = [float(t.strip()) for t in v.split(",") if t.strip()]
+            else:
+                kwargs[k] = float(v)
+        elif k == "prompt":
+            kwargs["initial_prompt"] = v
+        elif k == "suppress_tokens":
+            kwargs[k] = [int(t.strip()) for t in v.split(",") if t.strip()]
+        elif k in VAD_PARAM_TYPES:
+            name, typ = VAD_PARAM_TYPES[k]
+            vad_params[name] = typ(v)
+        elif PARAM_TYPES.get(k) is bool:
+            kwargs[k] = v.strip().lower() in ("true", "1", "yes")
+        elif k in PARAM_TYPES:
+            kwargs[k] = PARAM_TYPES[k](v)
+        else:
+            raise ValueError(f"unknown sweep param: {k}")
+    if kwargs.get("vad_filter"):
+        kwargs["vad_parameters"] = {**SERVER_VAD_DEFAULTS, **vad_params}
+    return kwargs
+
+
+# faster-whisper's own defaults, so configs that only spell out a default
+# (e.g. beam_size=5) resolve to the same key as the baseline
+TRANSCRIBE_DEFAULTS = {
+    name: p.default
+    for name, p in inspect.signature(WhisperModel.transcribe).parameters.items()
+    if p.default is not inspect.Parameter.empty
+}
+
+# (file, config_key) -> (label, result) for configs already transcribed
+RESULT_CACHE: dict[tuple[str, str], tuple[str, dict]] = {}
+
+
+def config_key(kwargs: dict) -> str:
+    """Stable key for the effective transcribe() arguments, defaults included."""
+    effective = {**TRANSCRIBE_DEFAULTS, **kwargs}
+    for k, v in effective.items():
+        if isinstance(v, list):
+            effective[k] = tuple(v)
+        elif isinstance(v, dict):
+            effective[k] = tuple(sorted(v.items()))
+    return repr(sorted(effective.items()))
+
+
+def transcribe_file(f: str, kwargs: dict) -> dict:
+    """Transcribe one cached file with the given kwargs, return its result."""
+    t0 = time.time()
+    try:
+        segments, info = model.transcribe(
+            AUDIO_CACHE[f], language="en", task="transcribe",
+            word_timestamps=True, **kwargs,
+        )
+        segs = list(segments)
+    except Exception as e:
+        return {"file": os.path.basename(f), "error": str(e)}
+
+    text = "".join(s.text for s in segs).strip()
+    dur = round(info.duration, 3)
+    ptime = round(time.time() - t0, 3)
+    words = [w for s in segs for w in (s.words or [])]
+
+    avg_prob = sum(w.probability for w in words) / len(words) if words else 0
+    min_prob = min((w.probability for w in words), default=0)
+    low_words = [w for w in words if w.probability < 0.3]
+
+    return {
+        "file": os.path.basename(f),
+        "duration": dur,
+        "proc_time": ptime,
+        "segments": len(segs),
+        "words": len(words),
+        "avg_prob": round(avg_prob, 3),
+        "min_prob": round(min_prob, 3),
+        "low_conf_words": len(low_words),
+        "text": text,
+    }
+
+
+async def run_test(label: str, params: dict) -> list[dict]:
+    """Run one test config across all files concurrently, return results.
+
+    Files already transcribed under an identical effective config reuse that
+    result instead of running the model again.
+    """
+    kwargs = to_kwargs(params)
+    key = config_key(kwargs)
+    sem = asyncio.Semaphore(CONCURRENCY)
+
+    async def run_one(f: str) -> dict:
+        async with sem:
+            return await asyncio.to_thread(transcribe_file, f, kwargs)
+
+    cached = {}
+    to_run = []
     for f in FILES:
-        if not os.path.exists(f):
+        if f not in AUDIO_CACHE:
             print(f"  SKIP (missing): {f}")
+        elif (f, key) in RESULT_CACHE:
+            src_label, r = RESULT_CACHE[(f, key)]
+            cached[f] = dict(r, cached_from=src_label)
+        else:
+            to_run.append(f)
+
+    fresh = await asyncio.gather(*(run_one(f) for f in to_run))
+    for f, r in zip(to_run, fresh):
+        if "error" not in r:
+            RESULT_CACHE[(f, key)] = (label, r)
+
+    # Reassemble in FILES order, so output matches the serial sweep
+    by_file = {**cached, **dict(zip(to_run, fresh))}
+    results = [by_file[f] for f in FILES if f in by_file]
+
+    for r in results:
+        if "error" in r:
+            print(f"  ERROR on {r['file']}: {r['error']}")
             continue
-
-        cmd = ["curl", "-s", "-X", "POST", URL, "-F", f"file=@{f}"]
-        # Always include these
-        cmd += ["-F", "language=en", "-F", "response_format=verbose_json",
-                "-F", "timestamp_granularities[]=word"]
-        for k, v in params.items():
-            cmd += ["-F", f"{k}={v}"]
-
-        try:
-            out = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-            data = json.loads(out.stdout)
-        except Exception as e:
-            print(f"  ERROR on {os.path.basename(f)}: {e}")
-            results.append({"file": os.path.basename(f), "error": str(e)})
-            continue
-
-        text = data.get("text", "")
-        dur = data.get("duration", 0)
-        ptime = data.get("processing_time", 0)
-        words = data.get("words", [])
-        segs = data.get("segments", [])
-
-        avg_prob = sum(w["probability"] for w in words) / len(words) if words else 0
-        min_prob = min((w["probability"] for w in words), default=0)
-        low_words = [w for w in words if w["probability"] < 0.3]
-
-        r = {
-            "file": os.path.basename(f),
-            "duration": dur,
-            "proc_time": ptime,
-            "segments": len(segs),
-            "words": len(words),
-            "avg_prob": round(avg_prob, 3),
-            "min_prob": round(min_prob, 3),
-            "low_conf_words": len(low_words),
-            "text": text,
-        }
-        results.append(r)
-
-        fname = os.path.basename(f)[:45]
-        print(f"  {fname:<45} dur={dur:<6} proc={ptime:<6} words={len(words):<3} "
-              f"avgP={avg_prob:.3f} minP={min_prob:.3f} low={len(low_words)}")
-        print(f"    > {text}")
+        fname = r["file"][:45]
+        note = f"  (cached: {r['cached_from']})" if "cached_from" in r else ""
+        print(f"  {fname:<45} dur={r['duration']:<6} proc={r['proc_time']:<6} "
+              f"words={r['words']:<3} avgP={r['avg_prob']:.3f} "
+              f"minP={r['min_prob']:.3f} low={r['low_conf_words']}{note}")
+        print(f"    > {r['text']}")
 
     return results
 
@@ -182,13 +348,15 @@ with open(OUTFILE, "w", encoding="utf-8") as out:
         out.write(header + "\n")
         out.flush()
 
-        results = run_test(label, params)
+        results = asyncio.run(run_test(label, params))
         all_results[label] = results
 
         for r in results:
             line = (f"  {r.get('file','?'):<45} dur={r.get('duration',0):<6} "
                     f"proc={r.get('proc_time',0):<6} avgP={r.get('avg_prob',0):.3f} "
                     f"minP={r.get('min_prob',0):.3f} low={r.get('low_conf_words',0)}")
+            if "cached_from" in r:
+                line += f"  (cached: {r['cached_from']})"
             out.write(line + "\n")
             out.write(f"    > {r.get('text','')}\n")
         out.flush()
@@ -202,10 +370,15 @@ with open(OUTFILE, "w", encoding="utf-8") as out:
         valid = [r for r in results if "error" not in r]
         if not valid:
             continue
-        avg_p = sum(r["avg_prob"] for r in valid) / len(valid)
-        min_p = min(r["min_prob"] for r in valid)
-        low_c = sum(r["low_conf_words"] for r in valid)
-        avg_t = sum(r["proc_time"] for r in valid) / len(valid)
+        n = len(valid)
+        avg_prob = np.fromiter((r["avg_prob"] for r in valid), dtype=np.float32, count=n)
+        min_prob = np.fromiter((r["min_prob"] for r in valid), dtype=np.float32, count=n)
+        low_conf = np.fromiter((r["low_conf_words"] for r in valid), dtype=np.int32, count=n)
+        proc_time = np.fromiter((r["proc_time"] for r in valid), dtype=np.float32, count=n)
+        avg_p = avg_prob.mean()
+        min_p = min_prob.min()
+        low_c = int(low_conf.sum())
+        avg_t = proc_time.mean()
         line = f"{label:<55} {avg_p:>8.3f} {min_p:>8.3f} {low_c:>8d} {avg_t:>8.3f}"
         print(line)
         out.write(line + "\n")